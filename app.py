@@ -1,173 +1,265 @@
-from fastapi import FastAPI, HTTPException, Form
+from fastapi import FastAPI, HTTPException, Form, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
-import requests
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import httpx
+import logging
 import os
-import json
+import orjson
+from typing import Any, Dict, Optional, Tuple
 
 
 # Import our custom modules
-from pubmed_rag import PubMedRAG
+from pubmed_rag import PubMedRAG, prepare_embeddings_model
 from triage_agent import TriageAgent
 
+# Verbose per-request logs in development, warnings and errors only otherwise
+logging.basicConfig(level=logging.DEBUG if os.getenv("DEV") else logging.WARNING)
+logger = logging.getLogger("medprompt")
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+MODEL_NAME = "medllama2"  # Using MedLLaMA 2 for symptom analysis
+
+# Prompt sent to the LLM, filled in per request with the symptoms, triage result and RAG context
+PROMPT_TEMPLATE = (
+    "You are a medical AI assistant providing brief, focused symptom analysis.\n"
+    "\n"
+    "User Symptoms: {symptoms}\n"
+    "\n"
+    "Triage Assessment:\n"
+    "- Severity: {severity}\n"
+    "- Care: {care_pathway}\n"
+    "\n"
+    "Medical Context:\n"
+    "{medical_context}\n"
+    "\n"
+    "Provide a VERY BRIEF response (maximum 250 words) with:\n"
+    "1. Possible explanations for these specific symptoms (2-3 sentences)\n"
+    "2. Brief self-care advice (2-3 bullet points)\n"
+    "3. When to seek medical help (1-2 sentences)\n"
+    "\n"
+    "IMPORTANT:\n"
+    "- Be extremely concise and specific\n"
+    "- Focus only on the symptoms described\n"
+    "- Avoid generic advice or repetition\n"
+    "- For serious symptoms, emphasize seeking care\n"
+    "\n"
+    "Medical AI:"
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Initialize our components and the shared async HTTP client in each worker
+    on startup, and close the clients on shutdown
+    """
+    app.state.pubmed_rag = PubMedRAG()
+    app.state.triage_agent = TriageAgent()
+    
+    # Warm up the embeddings model and triage rules so the first request doesn't pay for it
+    await asyncio.to_thread(app.state.pubmed_rag.embeddings.embed_query, "warmup")
+    await asyncio.to_thread(app.state.triage_agent.triage_symptoms, "warmup")
+    
+    app.state.http = httpx.AsyncClient(
+        base_url=OLLAMA_BASE_URL,
+        timeout=15,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50)
+    )
+    yield
+    await app.state.http.aclose()
+    await app.state.pubmed_rag.aclose()
+
 app = FastAPI(
     title="MedPrompt: LLM-Powered Medical Triage Assistant",
     description="An LLM agent system for patient triage and care routing",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Serve static files (HTML, CSS, JS)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Initialize our components
-pubmed_rag = PubMedRAG()
-triage_agent = TriageAgent()
+def _symptoms_etag(symptoms: str) -> str:
+    """ Build the ETag identifying the analysis of this exact symptom text """
+    return f'"{hashlib.blake2b(symptoms.encode(), digest_size=8).hexdigest()}"'
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "medllama2"  # Using MedLLaMA 2 for symptom analysis
+def _sse(data: str, event: Optional[str] = None) -> str:
+    """ Format a single server-sent event """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
 
-@app.get("/")
-def serve_homepage():
-    """ Serve the index.html file when accessing the root URL """
-    return FileResponse(os.path.join("static", "index.html"))
+def _sse_json(payload: dict, event: Optional[str] = None) -> str:
+    """ Format a server-sent event carrying a JSON payload """
+    return _sse(orjson.dumps(payload).decode(), event)
 
-@app.post("/analyze_symptoms")
-def analyze_symptoms(symptoms: str = Form(...)):
+def _ollama_error_message(error_msg: str) -> str:
+    """ Map an Ollama error payload to a user-facing message """
+    if "model" in error_msg and "not found" in error_msg:
+        return f"The medical AI model ({MODEL_NAME}) is not available in Ollama. " + \
+               f"Please pull it with 'ollama pull {MODEL_NAME}' and try again."
+    if "model requires more system memory" in error_msg:
+        return "The medical AI model requires more memory than is currently available on this system. " + \
+               "Please try again later when more system resources are available, or consider using a smaller model."
+    return f"The medical AI encountered an error: {error_msg}. Please try again later."
+
+async def _stream_analysis(state, symptoms: str):
     """
-    Analyze symptoms using RAG-enhanced LLM and provide triage recommendations
+    Stream the triage assessment followed by the LLM response as server-sent events.
+    
+    The first event (``triage``) is sent as soon as triage finishes, while
+    PubMed retrieval is still running. Each following message event carries the
+    text of one Ollama chunk, and failures are reported as a single ``error``
+    event with a user-facing message.
     """
+    # Steps 1 & 2: Triage and PubMed retrieval run concurrently, each shared with identical in-flight requests
+    triage_task = _coalesced(_triage, state, symptoms)
+    context_task = _coalesced(_medical_context, state, symptoms)
+    
     try:
-        # Step 1: Perform triage analysis
-        triage_result = triage_agent.triage_symptoms(symptoms)
-        
-        # Step 2: Get relevant medical context from PubMed
-        try:
-            medical_context = pubmed_rag.get_context_from_symptoms(symptoms)
-            print("Successfully retrieved medical context from PubMed")
-        except Exception as e:
-            print(f"Error retrieving medical context: {str(e)}")
-            # Use a generic medical context instead
-            medical_context = "Unable to retrieve specific medical literature at this time. " + \
-                             "The analysis will proceed based on general medical knowledge."
-        
-        # Step 3: Enhance the prompt with RAG context and triage information
-        headers = {"Content-Type": "application/json"}
-        
-        prompt = f"""You are a medical AI assistant providing brief, focused symptom analysis.
-        
-        User Symptoms: {symptoms}
-        
-        Triage Assessment: 
-        - Severity: {triage_result['severity']}
-        - Care: {triage_result['care_pathway']}
-        
-        Medical Context:
-        {medical_context}
-        
-        Provide a VERY BRIEF response (maximum 250 words) with:
-        1. Possible explanations for these specific symptoms (2-3 sentences)
-        2. Brief self-care advice (2-3 bullet points)
-        3. When to seek medical help (1-2 sentences)
-        
-        IMPORTANT:
-        - Be extremely concise and specific
-        - Focus only on the symptoms described
-        - Avoid generic advice or repetition
-        - For serious symptoms, emphasize seeking care
-        
-        Medical AI:"""
-        
-        # Step 4: Send the enhanced prompt to the LLM with a timeout
-        try:
-            # First check if Ollama is running
-            try:
-                health_check = requests.get("http://localhost:11434/api/tags", timeout=5)
-                if health_check.status_code != 200:
-                    raise ConnectionError("Ollama health check failed")
-                
-                # Check if medllama2 model is available
-                models_data = health_check.json()
-                model_available = False
-                for model in models_data.get("models", []):
-                    if model.get("name") == "medllama2:latest" or model.get("name") == MODEL_NAME:
-                        model_available = True
-                        break
-                
-                if not model_available:
-                    raise ConnectionError(f"Model {MODEL_NAME} not available in Ollama")
-                    
-            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
-                print("Ollama service is not running or not responding")
-                raise ConnectionError("Ollama service is not running")
-            except ValueError as ve:
-                print(f"Error parsing Ollama response: {str(ve)}")
-                raise ConnectionError("Error checking Ollama model availability")
+        triage_result = await triage_task
+    except Exception as e:
+        logger.exception("Error during triage: %s", e)
+        yield _sse_json({"response": f"Error analyzing symptoms: {str(e)}"}, event="error")
+        return
+    
+    # Send the triage assessment first so the frontend can render severity immediately
+    yield _sse_json({
+        "severity": triage_result["severity"],
+        "care_pathway": triage_result["care_pathway"],
+        "instructions": triage_result["instructions"]
+    }, event="triage")
+    
+    # Step 3: Enhance the prompt with RAG context and triage information
+    prompt = PROMPT_TEMPLATE.format(
+        symptoms=symptoms,
+        severity=triage_result["severity"],
+        care_pathway=triage_result["care_pathway"],
+        medical_context=await context_task
+    )
+    
+    # Step 4: Stream the enhanced prompt's completion from the LLM
+    try:
+        async with state.http.stream(
+            "POST",
+            "/api/generate",
+            content=orjson.dumps({
+                "model": MODEL_NAME, 
+                "prompt": prompt, 
+                "stream": True,
+                "num_predict": 256,  # Reduce token generation to prevent timeouts
+                "temperature": 0.7,   # Add some randomness but keep responses focused
+                "num_ctx": 2048,     # Reduce context size to help with memory issues
+                "num_gpu": 1         # Use GPU if available
+            }),
+            headers={"Content-Type": "application/json"},
+            timeout=15  # Maximum wait between streamed chunks
+        ) as response:
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
                 
-            response = requests.post(
-                OLLAMA_URL,
-                json={
-                    "model": MODEL_NAME, 
-                    "prompt": prompt, 
-                    "stream": False,
-                    "num_predict": 256,  # Reduce token generation to prevent timeouts
-                    "temperature": 0.7,   # Add some randomness but keep responses focused
-                    "num_ctx": 2048,     # Reduce context size to help with memory issues
-                    "num_gpu": 1         # Use GPU if available
-                },
-                headers=headers,
-                timeout=15  # Reduce timeout to 15 seconds
-            )
-            
-            print("Ollama Response:", response.text)
-            
-            # Ensure valid JSON response
-            response_data = response.text.strip()
-            try:
-                json_response = json.loads(response_data)
+                # Ensure valid JSON chunk
+                try:
+                    chunk = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    logger.warning("Invalid JSON response from Ollama: %s", line)
+                    yield _sse_json({"response": "I apologize, but I encountered an issue processing your symptoms. Please try again with a more concise description."}, event="error")
+                    return
                 
                 # Check for specific error messages
-                if "error" in json_response:
-                    error_msg = json_response["error"]
-                    print(f"Ollama error: {error_msg}")
-                    
-                    if "model requires more system memory" in error_msg:
-                        ai_response = "The medical AI model requires more memory than is currently available on this system. " + \
-                                     "Please try again later when more system resources are available, or consider using a smaller model."
-                    else:
-                        ai_response = f"The medical AI encountered an error: {error_msg}. Please try again later."
-                else:
-                    ai_response = json_response.get("response", "I'm sorry, but I couldn't generate a response.")
-            except json.JSONDecodeError:
-                print(f"Invalid JSON response from Ollama: {response_data}")
-                ai_response = "I apologize, but I encountered an issue processing your symptoms. Please try again with a more concise description."
-        except requests.exceptions.Timeout:
-            print("Ollama request timed out")
-            # Check if the symptoms are classified as emergency
-            if triage_result["severity"] == "emergency":
-                ai_response = "MEDICAL EMERGENCY DETECTED: Your symptoms suggest a potentially life-threatening condition that requires IMMEDIATE medical attention. " + \
-                             "Please call emergency services (911) or go to the nearest emergency room immediately. " + \
-                             "Do not wait for the AI analysis to complete."
-            else:
-                ai_response = "I apologize for the delay. The analysis is taking longer than expected. Please try again with a more concise description of your main symptoms."
-        except requests.exceptions.ConnectionError as ce:
-            print(f"Connection error when connecting to Ollama: {str(ce)}")
-            ai_response = "I'm unable to connect to the medical AI service at the moment. Please ensure Ollama is running with the medllama2 model loaded."
-        except Exception as e:
-            print(f"Error during Ollama request: {str(e)}")
-            ai_response = f"An unexpected error occurred: {str(e)}. Please try again with a simpler description."
-        
-        # Step 5: Return the combined response with triage information
-        return {
-            "response": ai_response,
-            "triage": {
-                "severity": triage_result["severity"],
-                "care_pathway": triage_result["care_pathway"],
-                "instructions": triage_result["instructions"]
-            }
-        }
-        
+                if "error" in chunk:
+                    logger.warning("Ollama error: %s", chunk["error"])
+                    yield _sse_json({"response": _ollama_error_message(chunk["error"])}, event="error")
+                    return
+                
+                # Forward only what the browser renders, not the final chunk's token context and timings
+                yield _sse_json({"response": chunk.get("response", ""), "done": chunk.get("done", False)})
+    except httpx.TimeoutException:
+        logger.warning("Ollama request timed out")
+        # Check if the symptoms are classified as emergency
+        if triage_result["severity"] == "emergency":
+            ai_response = "MEDICAL EMERGENCY DETECTED: Your symptoms suggest a potentially life-threatening condition that requires IMMEDIATE medical attention. " + \
+                         "Please call emergency services (911) or go to the nearest emergency room immediately. " + \
+                         "Do not wait for the AI analysis to complete."
+        else:
+            ai_response = "I apologize for the delay. The analysis is taking longer than expected. Please try again with a more concise description of your main symptoms."
+        yield _sse_json({"response": ai_response}, event="error")
+    except httpx.ConnectError as ce:
+        logger.error("Connection error when connecting to Ollama: %s", ce)
+        ai_response = "I'm unable to connect to the medical AI service at the moment. Please ensure Ollama is running with the medllama2 model loaded."
+        yield _sse_json({"response": ai_response}, event="error")
+    except Exception as e:
+        logger.exception("Error during Ollama request: %s", e)
+        ai_response = f"An unexpected error occurred: {str(e)}. Please try again with a simpler description."
+        yield _sse_json({"response": ai_response}, event="error")
+
+async def _triage(state, symptoms: str) -> Dict[str, Any]:
+    """ Run the CPU-bound triage analysis off the event loop """
+    return await asyncio.to_thread(state.triage_agent.triage_symptoms, symptoms)
+
+async def _medical_context(state, symptoms: str) -> str:
+    """ Retrieve PubMed context, falling back to a generic note when retrieval fails """
+    try:
+        medical_context = await state.pubmed_rag.get_context_from_symptoms(symptoms)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error analyzing symptoms: {str(e)}")
+        logger.warning("Error retrieving medical context: %s", e)
+        # Use a generic medical context instead
+        return "Unable to retrieve specific medical literature at this time. " + \
+               "The analysis will proceed based on general medical knowledge."
+    
+    logger.debug("Successfully retrieved medical context from PubMed")
+    return medical_context
+
+# Triage/retrieval work currently running, keyed by step and exact symptom text
+# (or its hash, for texts longer than _INFLIGHT_MAX_KEY_LENGTH)
+_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+_INFLIGHT_MAX_KEY_LENGTH = 2048
+
+def _coalesced(step, state, symptoms: str) -> asyncio.Future:
+    """
+    Run a step (_triage or _medical_context) once per distinct symptom text at
+    a time; concurrent identical requests (e.g. retry clicks) await the same result
+    """
+    if len(symptoms) > _INFLIGHT_MAX_KEY_LENGTH:
+        symptoms_key = hashlib.blake2b(symptoms.encode(), digest_size=16).hexdigest()
+    else:
+        symptoms_key = symptoms
+    key = (step.__name__, symptoms_key)
+    # No await between the lookup and the insert, so this is atomic on the event loop
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(step(state, symptoms))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # Shield the shared work so one client disconnecting doesn't cancel it for the others
+    return asyncio.shield(future)
+
+@app.get("/")
+def serve_homepage():
+    """ Serve the index.html file when accessing the root URL """
+    return FileResponse(os.path.join("static", "index.html"))
+
+@app.post("/analyze_symptoms")
+async def analyze_symptoms(request: Request, symptoms: str = Form(...)):
+    """
+    Analyze symptoms using RAG-enhanced LLM and stream triage recommendations
+    """
+    # Let clients that already hold the result for these exact symptoms reuse it
+    etag = _symptoms_etag(symptoms)
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # Steps 1-5 run inside the stream, so the triage event isn't held back by retrieval
+    return StreamingResponse(
+        _stream_analysis(request.app.state, symptoms),
+        media_type="text/event-stream",
+        headers={"ETag": etag, "Cache-Control": "private, max-age=300"}
+    )
 
 @app.get("/health")
 def health_check():
@@ -177,7 +269,27 @@ def health_check():
 # Run the API server
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # Export the embeddings model once, before any worker starts loading it
+    prepare_embeddings_model()
+    if os.getenv("DEV"):
+        # Single worker with auto-reload for development
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # One worker per CPU; "auto" picks uvloop and httptools when installed.
+        # Workers size their embedding thread pools to an equal share of the cores
+        # (and split the NCBI budget when diskcache is unavailable), so tell them
+        # how many there are
+        workers = os.cpu_count() or 1
+        os.environ["MEDPROMPT_WORKERS"] = str(workers)
+        uvicorn.run(
+            "app:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=workers,
+            loop="auto",
+            http="auto",
+            log_level="warning"
+        )
 
 
 
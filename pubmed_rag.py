@@ -5,29 +5,256 @@ using PubMed data to enhance the symptom analysis capabilities.
 """
 
 import os
-from typing import List, Dict, Any
+import re
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+import asyncio
+import logging
+import hashlib
+import time
+import httpx
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
 
-# Try to import Bio, but provide a fallback if not available
-try:
-    from Bio import Entrez
-    # Set your email for Entrez (required by NCBI)
-    Entrez.email = "medprompt@example.com"  # Application email for NCBI API
-    BIO_AVAILABLE = True
-except ImportError:
-    print("Warning: BioPython (Bio) module not found. Using mock PubMed data.")
-    BIO_AVAILABLE = False
+logger = logging.getLogger("medprompt.pubmed_rag")
 
 # Try to import LangChain dependencies
 try:
     from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from langchain_community.vectorstores import FAISS
     from langchain_huggingface import HuggingFaceEmbeddings
     from langchain.schema.document import Document
     LANGCHAIN_AVAILABLE = True
 except ImportError as e:
-    print(f"Warning: LangChain dependencies not found: {str(e)}. Using mock data.")
+    logger.warning("LangChain dependencies not found: %s. Using mock data.", e)
     LANGCHAIN_AVAILABLE = False
 
+# Try to import diskcache for persistent context caching
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    logger.warning("diskcache module not found. PubMed context will only be cached in memory.")
+    DISKCACHE_AVAILABLE = False
+
+# Try to import BM25 for cheap lexical pre-ranking of abstracts
+try:
+    from rank_bm25 import BM25Okapi
+    BM25_AVAILABLE = True
+except ImportError:
+    logger.info("rank_bm25 not found. All fetched abstracts will be embedded.")
+    BM25_AVAILABLE = False
+
+# Try to import ONNX Runtime dependencies for the quantized embeddings model
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    import onnxruntime
+    ONNX_AVAILABLE = True
+except ImportError:
+    logger.info("optimum[onnxruntime] not found. Using the PyTorch embeddings model.")
+    ONNX_AVAILABLE = False
+
+# Try to import PyTorch to size the thread pool of the PyTorch embeddings model
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# NCBI E-utilities endpoint and identification (required by NCBI)
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+NCBI_TOOL = "medprompt"
+NCBI_EMAIL = "medprompt@example.com"  # Application email for NCBI API
+
+# Characters replaced by spaces when turning symptoms into a PubMed query
+_CLEAN_TABLE = str.maketrans({"\n": " ", "-": " ", "\r": " ", "\t": " "})
+
+# Tokenizer for BM25 pre-ranking
+_TOKEN_RE = re.compile(r"\w+")
+
+# NCBI allows 3 E-utilities requests per second without an API key and 10 with one.
+# The budget is shared by every worker process of the app
+NCBI_RATE_LIMIT = 3
+NCBI_RATE_LIMIT_WITH_KEY = 10
+
+# Subdirectory of the cache directory holding the quantized embeddings model
+ONNX_MODEL_DIR = "onnx-minilm-int8"
+
+# How long a retrieved context stays valid in the disk cache
+CONTEXT_CACHE_EXPIRE = 24 * 60 * 60  # 24 hours
+# Number of recent contexts kept in memory (each expires with its disk cache entry)
+MEMORY_CACHE_SIZE = 512
+# Longer symptom texts are kept in memory under a hash rather than the text itself
+MEMORY_CACHE_MAX_KEY_LENGTH = 2048
+
+class QuantizedEmbeddings:
+    """
+    Sentence embeddings from an int8-quantized ONNX export of a
+    sentence-transformers model, mirroring the HuggingFaceEmbeddings interface
+    """
+    
+    QUANTIZED_FILE = "model_quantized.onnx"
+    
+    def __init__(self, model_name: str, model_dir: str, batch_size: int = 64, max_length: int = 256,
+                 num_threads: int = 0):
+        """
+        Load the quantized model, exporting and quantizing it on first use
+        
+        Args:
+            model_name: Hugging Face model to export
+            model_dir: Directory holding the exported and quantized model
+            batch_size: Number of texts encoded per forward pass
+            max_length: Maximum number of tokens per text
+            num_threads: Threads used within an operator (0 lets ONNX Runtime use one per core)
+        """
+        self.batch_size = batch_size
+        self.max_length = max_length
+        
+        self.export(model_name, model_dir)
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=self.QUANTIZED_FILE,
+            session_options=session_options
+        )
+    
+    @classmethod
+    def export(cls, model_name: str, model_dir: str):
+        """
+        Export and quantize the model into model_dir unless it is already there.
+        The export is written to a temporary directory and renamed into place, so
+        concurrent worker processes never load a half-written model
+        
+        Args:
+            model_name: Hugging Face model to export
+            model_dir: Directory holding the exported and quantized model
+        """
+        if os.path.exists(os.path.join(model_dir, cls.QUANTIZED_FILE)):
+            return
+        
+        logger.info("Exporting %s to ONNX with dynamic int8 quantization...", model_name)
+        parent = os.path.dirname(os.path.abspath(model_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".onnx-export-", dir=parent)
+        try:
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(tmp_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(tmp_dir)
+            
+            quantizer = ORTQuantizer.from_pretrained(model)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+            
+            try:
+                os.replace(tmp_dir, model_dir)
+            except OSError:
+                # Another process moved its complete export into place first
+                if not os.path.exists(os.path.join(model_dir, cls.QUANTIZED_FILE)):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts into mean-pooled, L2-normalized embeddings
+        
+        Args:
+            texts: Texts to encode
+            
+        Returns:
+            Array of shape (len(texts), dim)
+        """
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            token_embeddings = np.asarray(self.model(**inputs).last_hidden_state, dtype=np.float32)
+            
+            # Mean pooling over non-padding tokens, as sentence-transformers does
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            batches.append(pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12))
+        
+        return np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+    
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Embed a list of documents"""
+        return self._encode(list(texts))
+    
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed a single query"""
+        return self._encode([text])[0]
+
+class RateLimiter:
+    """
+    Lets at most `rate` calls start in any window of `period` seconds. Calls
+    within that budget start immediately, so the few E-utilities calls of one
+    request go out back to back. Given a diskcache.Cache, the recent start times
+    are kept in it and the budget is shared by every process using that cache
+    """
+    
+    KEY = "eutils-rate-limit"
+    
+    def __init__(self, rate: int, period: float = 1.0, cache=None):
+        """
+        Initialize the limiter
+        
+        Args:
+            rate: Maximum number of calls started per period
+            period: Length of the window in seconds
+            cache: Optional diskcache.Cache shared with other processes
+        """
+        self.rate = rate
+        self.period = period
+        self.cache = cache
+        self._starts: List[float] = []
+    
+    def _schedule(self, starts: List[float]) -> float:
+        """
+        Reserve the earliest allowed start time and record it in starts
+        
+        Args:
+            starts: Start times of the most recent calls, oldest first
+            
+        Returns:
+            Seconds to wait before starting the call
+        """
+        now = time.time()
+        start = now if len(starts) < self.rate else max(now, starts[0] + self.period)
+        starts.append(start)
+        del starts[:-self.rate]
+        return start - now
+    
+    def _reserve_shared(self) -> float:
+        """Reserve a start time in the shared cache (blocking SQLite I/O)"""
+        with self.cache.transact():
+            starts = self.cache.get(self.KEY, [])
+            delay = self._schedule(starts)
+            self.cache.set(self.KEY, starts)
+        return delay
+    
+    async def wait(self):
+        """Wait until the next call is allowed to start"""
+        if self.cache is None:
+            # No await while reserving, so this is atomic on the event loop
+            delay = self._schedule(self._starts)
+        else:
+            delay = await asyncio.to_thread(self._reserve_shared)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
 class PubMedRAG:
     """
     A class to implement RAG pipeline using PubMed data
@@ -44,42 +271,123 @@ class PubMedRAG:
         os.makedirs(cache_dir, exist_ok=True)
         
         # Check for required dependencies
-        if not BIO_AVAILABLE:
-            print("ERROR: BioPython (Bio) module is required but not found.")
-            print("Please install it with: pip install biopython")
-            raise ImportError("BioPython (Bio) module is required")
-            
         if not LANGCHAIN_AVAILABLE:
-            print("ERROR: LangChain dependencies are required but not found.")
-            print("Please install them with: pip install langchain langchain_community langchain_huggingface faiss-cpu")
+            logger.error("LangChain dependencies are required but not found. "
+                         "Please install them with: pip install langchain langchain_community langchain_huggingface")
             raise ImportError("LangChain dependencies are required")
             
         self.mock_mode = False
         
         try:
-            # Initialize embeddings model
-            print("Initializing HuggingFaceEmbeddings...")
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2"
+            # Initialize the NCBI E-utilities HTTP client (pooled, shared by all requests)
+            self.http = httpx.AsyncClient(
+                base_url=EUTILS_URL,
+                timeout=10,
+                limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
             )
+            # Each worker process loads its own model, so give each an equal share of
+            # the cores rather than letting every one of them start a thread per core
+            workers = max(1, int(os.getenv("MEDPROMPT_WORKERS", "1")))
+            num_threads = max(1, (os.cpu_count() or 1) // workers)
             
-            # Initialize text splitter
-            print("Initializing RecursiveCharacterTextSplitter...")
+            # Initialize embeddings model (int8 ONNX when available, PyTorch otherwise)
+            if ONNX_AVAILABLE:
+                logger.info("Initializing QuantizedEmbeddings...")
+                self.embeddings = QuantizedEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME,
+                    model_dir=os.path.join(cache_dir, ONNX_MODEL_DIR),
+                    batch_size=64,
+                    num_threads=num_threads
+                )
+            else:
+                logger.info("Initializing HuggingFaceEmbeddings...")
+                if TORCH_AVAILABLE:
+                    torch.set_num_threads(num_threads)
+                self.embeddings = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME,
+                    encode_kwargs={"batch_size": 64, "normalize_embeddings": True}
+                )
+            
+            # Initialize text splitter. Both embeddings backends truncate input at 256
+            # tokens (about 1000-1200 characters), so chunks are kept under that to
+            # let the whole abstract count towards ranking; typical abstracts become 1-2 chunks
+            logger.info("Initializing RecursiveCharacterTextSplitter...")
             self.text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=1000,
-                chunk_overlap=200
+                chunk_overlap=0
             )
             
-            # Initialize vector store
-            self.vector_store = None
-            print("RAG pipeline initialized successfully")
+            # Initialize context caches (persistent on disk, hot entries in memory)
+            self.disk_cache = diskcache.Cache(cache_dir) if DISKCACHE_AVAILABLE else None
+            
+            # Stay under NCBI's rate limit. The disk cache is shared by all worker
+            # processes, so they draw from one budget; without it each worker gets
+            # an equal share, one call at a time
+            rate = NCBI_RATE_LIMIT_WITH_KEY if os.getenv("NCBI_API_KEY") else NCBI_RATE_LIMIT
+            if self.disk_cache is not None:
+                self.rate_limiter = RateLimiter(rate, cache=self.disk_cache)
+            else:
+                self.rate_limiter = RateLimiter(1, period=workers / rate)
+            self._memory_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+            logger.info("RAG pipeline initialized successfully")
         except Exception as e:
-            print(f"Error initializing RAG pipeline: {str(e)}")
+            logger.error("Error initializing RAG pipeline: %s", e)
             raise RuntimeError(f"Failed to initialize RAG pipeline: {str(e)}")
     
-    def search_pubmed(self, query: str, max_results: int = 5) -> List[str]:
+    async def aclose(self):
+        """Close the E-utilities HTTP client"""
+        await self.http.aclose()
+    
+    def _eutils_params(self, **params) -> Dict[str, Any]:
+        """
+        Build E-utilities query parameters with NCBI identification
+        
+        Args:
+            **params: Endpoint-specific parameters
+            
+        Returns:
+            Query parameters for an E-utilities request
+        """
+        params.update(db="pubmed", tool=NCBI_TOOL, email=NCBI_EMAIL)
+        api_key = os.getenv("NCBI_API_KEY")
+        if api_key:
+            params["api_key"] = api_key
+        return params
+    
+    async def _eutils_get(self, path: str, **params) -> httpx.Response:
+        """
+        Send a rate-limited E-utilities GET request
+        
+        Args:
+            path: Endpoint path, e.g. "/esearch.fcgi"
+            **params: Endpoint-specific parameters
+            
+        Returns:
+            Successful HTTP response
+        """
+        await self.rate_limiter.wait()
+        response = await self.http.get(path, params=self._eutils_params(**params))
+        response.raise_for_status()
+        return response
+    
+    async def _esearch(self, term: str, max_results: int) -> List[str]:
+        """
+        Run a single PubMed esearch query
+        
+        Args:
+            term: Search term
+            max_results: Maximum number of results to return
+            
+        Returns:
+            List of PubMed IDs
+        """
+        response = await self._eutils_get("/esearch.fcgi", term=term, retmax=max_results, retmode="json")
+        return response.json()["esearchresult"].get("idlist", [])
+    
+    async def search_pubmed(self, query: str, max_results: int = 5) -> List[str]:
         """
-        Search PubMed for articles related to the query
+        Search PubMed for articles related to the query, falling back to a more
+        general search if the specific query finds nothing
         
         Args:
             query: Search query for PubMed
@@ -89,35 +397,60 @@ class PubMedRAG:
             List of PubMed IDs
         """
         try:
-            print(f"Searching PubMed for: {query}")
-            # Search PubMed
-            search_handle = Entrez.esearch(db="pubmed", term=query, retmax=max_results)
-            search_results = Entrez.read(search_handle)
-            search_handle.close()
-            
-            # Get the ID list
-            id_list = search_results.get("IdList", [])
+            logger.debug("Searching PubMed for: %s", query)
+            id_list = await self._esearch(query, max_results)
             
             if not id_list:
-                print(f"No PubMed articles found for query: {query}")
-                # Try a more general search if specific query returns no results
-                general_terms = query.split()[:3]  # Use first few words for a more general search
-                general_query = " OR ".join(general_terms)
-                print(f"Trying more general search: {general_query}")
-                
-                search_handle = Entrez.esearch(db="pubmed", term=general_query, retmax=max_results)
-                search_results = Entrez.read(search_handle)
-                search_handle.close()
-                
-                id_list = search_results.get("IdList", [])
+                logger.debug("No PubMed articles found for query: %s", query)
+                # Fall back to a more general search using the first few words
+                general_query = " OR ".join(query.split()[:3])
+                logger.debug("Using more general search: %s", general_query)
+                id_list = await self._esearch(general_query, max_results)
                 
-            print(f"Found {len(id_list)} PubMed articles")
+            logger.debug("Found %d PubMed articles", len(id_list))
             return id_list
         except Exception as e:
-            print(f"Error searching PubMed: {str(e)}")
+            logger.warning("Error searching PubMed: %s", e)
             raise RuntimeError(f"Failed to search PubMed: {str(e)}")
     
-    def fetch_pubmed_articles(self, pmids: List[str]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _parse_articles(content: bytes) -> List[Dict[str, Any]]:
+        """
+        Extract titles and abstracts from efetch XML. ElementTree does not load
+        the PubMed DTD, so this stays cheap compared to a validating parser
+        
+        Args:
+            content: Response body of efetch with retmode=xml
+            
+        Returns:
+            List of article data, in the order returned by PubMed
+        """
+        articles = []
+        for citation in ET.fromstring(content).iter("MedlineCitation"):
+            pmid = citation.findtext("PMID")
+            article = citation.find("Article")
+            if not pmid or article is None:
+                continue
+            
+            title_element = article.find("ArticleTitle")
+            title = "".join(title_element.itertext()) if title_element is not None else ""
+            
+            # Structured abstracts have one labeled AbstractText per section
+            sections = []
+            for section in article.iterfind("Abstract/AbstractText"):
+                text = " ".join("".join(section.itertext()).split())
+                label = section.get("Label")
+                sections.append(f"{label}: {text}" if label and text else text)
+            abstract = " ".join(section for section in sections if section)
+            
+            articles.append({
+                "pmid": pmid.strip(),
+                "title": " ".join(title.split()),
+                "abstract": abstract or "No abstract available for this article."
+            })
+        return articles
+    
+    async def fetch_pubmed_articles(self, pmids: List[str]) -> List[Dict[str, Any]]:
         """
         Fetch PubMed articles by their IDs
         
@@ -128,42 +461,45 @@ class PubMedRAG:
             List of article data
         """
         if not pmids:
-            print("No PubMed IDs provided to fetch")
+            logger.debug("No PubMed IDs provided to fetch")
             raise ValueError("No PubMed IDs provided to fetch articles")
             
         try:
-            print(f"Fetching {len(pmids)} PubMed articles...")
-            # Fetch articles
-            fetch_handle = Entrez.efetch(db="pubmed", id=pmids, rettype="xml")
-            articles = Entrez.read(fetch_handle)
-            fetch_handle.close()
+            logger.debug("Fetching %d PubMed articles...", len(pmids))
+            ids = ",".join(pmids)
             
-            results = []
-            for article in articles["PubmedArticle"]:
-                article_data = {}
-                
-                # Extract article metadata
-                article_data["pmid"] = article["MedlineCitation"]["PMID"]
-                article_data["title"] = article["MedlineCitation"]["Article"]["ArticleTitle"]
-                
-                # Extract abstract if available
-                if "Abstract" in article["MedlineCitation"]["Article"]:
-                    abstract_parts = article["MedlineCitation"]["Article"]["Abstract"]["AbstractText"]
-                    article_data["abstract"] = " ".join([str(part) for part in abstract_parts])
-                else:
-                    article_data["abstract"] = "No abstract available for this article."
-                
-                results.append(article_data)
+            # Titles and abstracts both come from a single efetch XML request
+            response = await self._eutils_get("/efetch.fcgi", id=ids, retmode="xml")
+            results = self._parse_articles(response.content)
             
             if not results:
-                print("No article data could be extracted from PubMed")
+                logger.debug("No article data could be extracted from PubMed")
                 raise ValueError("Failed to extract article data from PubMed")
                 
             return results
         except Exception as e:
-            print(f"Error fetching PubMed articles: {str(e)}")
+            logger.warning("Error fetching PubMed articles: %s", e)
             raise RuntimeError(f"Failed to fetch PubMed articles: {str(e)}")
     
+    def prerank_articles(self, articles: List[Dict[str, Any]], query: str, n: int = 5) -> List[Dict[str, Any]]:
+        """
+        Keep only the articles that best match the query lexically (BM25),
+        so that only those are embedded
+        
+        Args:
+            articles: List of article data
+            query: Query string
+            n: Number of articles to keep
+            
+        Returns:
+            Up to n articles, best match first
+        """
+        if not BM25_AVAILABLE or len(articles) <= n:
+            return articles
+        
+        tokenized = [_TOKEN_RE.findall(f"{a['title']} {a['abstract']}".lower()) for a in articles]
+        return BM25Okapi(tokenized).get_top_n(_TOKEN_RE.findall(query.lower()), articles, n=n)
+    
     def create_documents_from_articles(self, articles: List[Dict[str, Any]]) -> List:
         """
         Create LangChain documents from PubMed articles
@@ -200,45 +536,47 @@ class PubMedRAG:
         
         return documents
     
-    def build_vector_store(self, documents: List):
+    def query_documents(self, documents: List, query: str, k: int = 3) -> List:
         """
-        Build a vector store from documents
-        
-        Args:
-            documents: List of documents to index
-        """
-        if self.mock_mode:
-            # Skip vector store creation in mock mode
-            return
-            
-        # Split documents into chunks
-        splits = self.text_splitter.split_documents(documents)
-        
-        # Create vector store
-        self.vector_store = FAISS.from_documents(splits, self.embeddings)
-    
-    def query_vector_store(self, query: str, k: int = 3) -> List:
-        """
-        Query the vector store for relevant documents
+        Retrieve the document chunks most similar to the query
         
         Args:
+            documents: List of documents to search
             query: Query string
             k: Number of documents to retrieve
             
         Returns:
-            List of relevant documents
+            List of relevant documents, most similar first
         """
         if self.mock_mode:
             # Return the mock documents directly
-            mock_docs = self.create_documents_from_articles(self.fetch_pubmed_articles([]))
-            return mock_docs[:k]
+            return documents[:k]
             
-        if not self.vector_store:
-            raise ValueError("Vector store not initialized. Call build_vector_store first.")
+        # Split documents into chunks
+        splits = self.text_splitter.split_documents(documents)
+        if not splits:
+            return []
+        
+        # Embed the chunks and the query; both embeddings backends return
+        # L2-normalized vectors, so one float32 matrix-vector product (BLAS sgemv)
+        # gives the cosine similarities directly
+        doc_embeddings = np.asarray(
+            self.embeddings.embed_documents([split.page_content for split in splits]),
+            dtype=np.float32
+        )
+        query_embedding = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        scores = doc_embeddings @ query_embedding
+        
+        # Select the top k without a full sort, then order them by score
+        if len(splits) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(splits))
+        top = top[np.argsort(-scores[top])]
         
-        return self.vector_store.similarity_search(query, k=k)
+        return [splits[i] for i in top]
     
-    def process_symptoms(self, symptoms: str) -> List:
+    async def process_symptoms(self, symptoms: str) -> List:
         """
         Process symptoms to retrieve relevant medical information
         
@@ -249,34 +587,34 @@ class PubMedRAG:
             List of relevant documents
         """
         try:
-            print(f"Processing symptoms: {symptoms}")
+            logger.debug("Processing symptoms: %s", symptoms)
             
             # Clean up symptoms text
-            clean_symptoms = symptoms.replace("\n", " ").replace("-", " ").strip()
+            clean_symptoms = symptoms.translate(_CLEAN_TABLE).strip()
             
             # Search PubMed for relevant articles
-            pmids = self.search_pubmed(clean_symptoms, max_results=10)
+            pmids = await self.search_pubmed(clean_symptoms, max_results=10)
             
             if not pmids:
-                print("No PubMed articles found for the symptoms.")
+                logger.debug("No PubMed articles found for the symptoms.")
                 raise ValueError("No PubMed articles found for the given symptoms")
             
             # Fetch articles
-            articles = self.fetch_pubmed_articles(pmids)
+            articles = await self.fetch_pubmed_articles(pmids)
+            
+            # Pre-rank abstracts so only the best candidates are embedded
+            articles = self.prerank_articles(articles, clean_symptoms, n=5)
             
             # Create documents
             documents = self.create_documents_from_articles(articles)
             
-            # Build vector store
-            self.build_vector_store(documents)
-            
-            # Query vector store
-            return self.query_vector_store(clean_symptoms, k=3)
+            # Retrieve the most relevant chunks (embedding is CPU-bound, keep it off the event loop)
+            return await asyncio.to_thread(self.query_documents, documents, clean_symptoms, 3)
         except Exception as e:
-            print(f"Error processing symptoms: {str(e)}")
+            logger.warning("Error processing symptoms: %s", e)
             raise RuntimeError(f"Failed to process symptoms: {str(e)}")
     
-    def get_context_from_symptoms(self, symptoms: str) -> str:
+    async def get_context_from_symptoms(self, symptoms: str) -> str:
         """
         Get context from symptoms for LLM prompt enhancement
         
@@ -287,12 +625,74 @@ class PubMedRAG:
             Context string for LLM prompt
         """
         if not symptoms or len(symptoms.strip()) < 3:
-            print("Warning: Symptoms text is too short or empty")
+            logger.debug("Symptoms text is too short or empty")
             raise ValueError("Symptom text is too short or empty")
             
+        normalized = self._normalize_symptoms(symptoms)
+        key = self._cache_key(normalized) if len(normalized) > MEMORY_CACHE_MAX_KEY_LENGTH else normalized
+        
+        # Serve recent contexts straight from memory until they expire
+        entry = self._memory_cache.get(key)
+        if entry is not None:
+            context, expires_at = entry
+            if expires_at > time.time():
+                self._memory_cache.move_to_end(key)
+                return context
+            del self._memory_cache[key]
+        
+        context, expires_at = await self._build_context(normalized)
+        self._memory_cache[key] = (context, expires_at)
+        if len(self._memory_cache) > MEMORY_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+        return context
+    
+    @staticmethod
+    def _normalize_symptoms(symptoms: str) -> str:
+        """
+        Normalize symptom text so equivalent inputs share a cache entry
+        
+        Args:
+            symptoms: User symptoms
+            
+        Returns:
+            Lowercased symptom text with whitespace collapsed
+        """
+        return " ".join(symptoms.lower().split())
+    
+    @staticmethod
+    def _cache_key(symptoms: str) -> str:
+        """
+        Hash normalized symptom text into a fixed-size cache key
+        
+        Args:
+            symptoms: Normalized user symptoms
+            
+        Returns:
+            Hex digest of the symptom text
+        """
+        return hashlib.blake2b(symptoms.encode(), digest_size=16).hexdigest()
+    
+    async def _build_context(self, symptoms: str) -> Tuple[str, float]:
+        """
+        Build the context string for normalized symptoms, using the disk cache when possible
+        
+        Args:
+            symptoms: Normalized user symptoms
+            
+        Returns:
+            Context string for LLM prompt and the time.time() at which it expires
+        """
+        key = self._cache_key(symptoms)
+        # diskcache is blocking SQLite I/O shared with the other workers, so keep it off the event loop
+        if self.disk_cache is not None:
+            cached, expire_time = await asyncio.to_thread(self.disk_cache.get, key, expire_time=True)
+            if cached is not None:
+                logger.debug("Using cached context for symptoms: %s", symptoms)
+                return cached, expire_time or time.time() + CONTEXT_CACHE_EXPIRE
+            
         try:
-            print(f"Getting context for symptoms: {symptoms}")
-            relevant_docs = self.process_symptoms(symptoms)
+            logger.debug("Getting context for symptoms: %s", symptoms)
+            relevant_docs = await self.process_symptoms(symptoms)
             
             if not relevant_docs:
                 raise ValueError("No relevant medical literature found for these symptoms")
@@ -306,14 +706,28 @@ class PubMedRAG:
                     content = doc.page_content
                 context += f"Source {i}:\n{content}\n\n"
             
-            return context
+            if self.disk_cache is not None:
+                await asyncio.to_thread(self.disk_cache.set, key, context, expire=CONTEXT_CACHE_EXPIRE)
+            
+            return context, time.time() + CONTEXT_CACHE_EXPIRE
         except Exception as e:
             error_msg = str(e)
-            print(f"Error retrieving PubMed context: {error_msg}")
+            logger.warning("Error retrieving PubMed context: %s", error_msg)
             raise RuntimeError(f"Failed to retrieve medical context: {error_msg}")
 
+def prepare_embeddings_model(cache_dir: str = "pubmed_cache"):
+    """
+    Export the quantized embeddings model ahead of time, so worker processes
+    started afterwards only load it
+    
+    Args:
+        cache_dir: Cache directory later passed to PubMedRAG
+    """
+    if ONNX_AVAILABLE:
+        QuantizedEmbeddings.export(EMBEDDING_MODEL_NAME, os.path.join(cache_dir, ONNX_MODEL_DIR))
+
 # Example usage
 if __name__ == "__main__":
     rag = PubMedRAG()
-    context = rag.get_context_from_symptoms("persistent headache with fever and neck stiffness")
+    context = asyncio.run(rag.get_context_from_symptoms("persistent headache with fever and neck stiffness"))
     print(context)
\ No newline at end of file
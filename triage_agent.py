@@ -4,17 +4,171 @@ This module implements a decision tree-based triage agent to classify
 symptom severity and recommend appropriate care pathways.
 """
 
-from enum import Enum
-from typing import List, Dict, Any
+from enum import Enum, IntEnum
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple, Union
+import logging
 import re
+import threading
 
-class TriageSeverity(Enum):
-    """Enumeration of triage severity levels"""
-    EMERGENCY = "emergency"  # Immediate medical attention needed
-    URGENT = "urgent"        # Care needed within 24 hours
-    SEMI_URGENT = "semi-urgent"  # Care needed within 72 hours
-    ROUTINE = "routine"      # Care needed but not urgent
-    SELF_CARE = "self-care"  # Can be managed at home
+logger = logging.getLogger("medprompt.triage_agent")
+
+# Try to import Hyperscan for single-pass multi-pattern matching
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+# Try to import pyahocorasick for single-pass keyword group matching
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+class TriageSeverity(IntEnum):
+    """Enumeration of triage severity levels, ordered so lower is more severe"""
+    EMERGENCY = 0    # Immediate medical attention needed
+    URGENT = 1       # Care needed within 24 hours
+    SEMI_URGENT = 2  # Care needed within 72 hours
+    ROUTINE = 3      # Care needed but not urgent
+    SELF_CARE = 4    # Can be managed at home
+
+# Serialized name of each severity level
+_LABELS = {
+    TriageSeverity.EMERGENCY: "emergency",
+    TriageSeverity.URGENT: "urgent",
+    TriageSeverity.SEMI_URGENT: "semi-urgent",
+    TriageSeverity.ROUTINE: "routine",
+    TriageSeverity.SELF_CARE: "self-care"
+}
+
+# Delimiters for a single-line symptom list, by priority; only the first one
+# present is used, so "fever, chills - cough" splits on " - " alone
+_INLINE_DELIMITERS = (" - ", "• ", ", ")
+
+# Number of distinct symptom strings whose triage results are kept in memory
+TRIAGE_CACHE_SIZE = 4096
+# Longer symptom strings are triaged without caching, so large inputs can't pin memory
+TRIAGE_CACHE_MAX_LENGTH = 2048
+
+# Keyword groups checked against the lowercased symptom text, one bit per group
+_CHRONIC = 1 << 0
+_WORSENING = 1 << 1
+_SEVERE = 1 << 2
+_SEVERE_PAIN = 1 << 3
+_ASTHMA = 1 << 4
+_ASTHMA_ATTACK = 1 << 5
+_BLOOD_SUGAR = 1 << 6
+_DANGEROUS_SUGAR = 1 << 7
+_BACK_PAIN = 1 << 8
+_SEVERE_BACK_PAIN = 1 << 9
+
+_KEYWORD_GROUPS = {
+    _CHRONIC: frozenset({"chronic", "persistent", "ongoing", "months", "weeks"}),
+    _WORSENING: frozenset({"worse", "worsening", "increased", "higher", "elevated"}),
+    _SEVERE: frozenset({"severe", "extreme", "intense", "unbearable", "worst"}),
+    _SEVERE_PAIN: frozenset({"pain", "headache", "chest", "breathing"}),
+    _ASTHMA: frozenset({"asthma"}),
+    _ASTHMA_ATTACK: frozenset({"attack", "can't breathe", "severe", "emergency"}),
+    _BLOOD_SUGAR: frozenset({"blood sugar", "diabetes"}),
+    _DANGEROUS_SUGAR: frozenset({"very high", "extremely", "dangerously"}),
+    _BACK_PAIN: frozenset({"back pain"}),
+    _SEVERE_BACK_PAIN: frozenset({"severe", "can't move", "debilitating"})
+}
+
+def _build_keyword_masks() -> Tuple[Tuple[str, int], ...]:
+    """
+    Map each distinct keyword to the bits of every group it belongs to
+    
+    Returns:
+        Tuple of (keyword, bitmask) pairs
+    """
+    masks: Dict[str, int] = {}
+    for bit, terms in _KEYWORD_GROUPS.items():
+        for term in terms:
+            masks[term] = masks.get(term, 0) | bit
+    return tuple(masks.items())
+
+def _build_keyword_automaton() -> Any:
+    """
+    Build an Aho-Corasick automaton over every keyword, valued by its group bits
+    
+    Returns:
+        ahocorasick.Automaton ready for iter()
+    """
+    automaton = ahocorasick.Automaton()
+    for term, mask in _KEYWORD_MASKS:
+        automaton.add_word(term, mask)
+    automaton.make_automaton()
+    return automaton
+
+_KEYWORD_MASKS = _build_keyword_masks()
+if AHOCORASICK_AVAILABLE:
+    _KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+def _keyword_flags(text: str) -> int:
+    """
+    Find which keyword groups occur in the text
+    
+    Args:
+        text: Lowercased symptom text
+        
+    Returns:
+        Bitmask of the matched keyword groups
+    """
+    flags = 0
+    if AHOCORASICK_AVAILABLE:
+        # One pass over the text reports every (possibly overlapping) keyword
+        for _, mask in _KEYWORD_AUTOMATON.iter(text):
+            flags |= mask
+    else:
+        # Keywords must match as substrings ("painful" counts as "pain"), so test
+        # each distinct keyword once rather than tokenizing the text
+        for term, mask in _KEYWORD_MASKS:
+            if term in text:
+                flags |= mask
+    return flags
+
+# Condition-specific rules, checked in order: (condition bit, [(modifier bits,
+# severity, reason), ...], default severity, default reason); the first
+# condition present decides, and within it the first modifier that matched
+_CONDITIONS = (
+    (_ASTHMA, [
+        (_ASTHMA_ATTACK, TriageSeverity.EMERGENCY, "severe asthma"),
+        (_WORSENING, TriageSeverity.SEMI_URGENT, "worsening asthma")
+    ], TriageSeverity.ROUTINE, "stable asthma"),
+    (_BLOOD_SUGAR, [
+        (_DANGEROUS_SUGAR, TriageSeverity.URGENT, "dangerous blood sugar"),
+        (_WORSENING, TriageSeverity.SEMI_URGENT, "elevated blood sugar")
+    ], TriageSeverity.ROUTINE, "blood sugar concern"),
+    (_BACK_PAIN, [
+        (_SEVERE_BACK_PAIN, TriageSeverity.SEMI_URGENT, "severe back pain"),
+        (_CHRONIC, TriageSeverity.ROUTINE, "chronic back pain")
+    ], TriageSeverity.SELF_CARE, "mild back pain")
+)
+
+def _classify_condition(symptom: str, flags: int) -> Optional[TriageSeverity]:
+    """
+    Classify a symptom that mentions one of the specific chronic conditions
+    
+    Args:
+        symptom: Symptom text, used for logging
+        flags: Keyword group bitmask from _keyword_flags
+        
+    Returns:
+        TriageSeverity level, or None if no specific condition is mentioned
+    """
+    for condition, modifiers, default, default_reason in _CONDITIONS:
+        if flags & condition:
+            for modifier, severity, reason in modifiers:
+                if flags & modifier:
+                    logger.debug("Classified as %s (%s): %s", severity.name, reason, symptom)
+                    return severity
+            logger.debug("Classified as %s (%s): %s", default.name, default_reason, symptom)
+            return default
+    return None
 
 class CarePathway(Enum):
     """Enumeration of care pathways"""
@@ -24,118 +178,389 @@ class CarePathway(Enum):
     TELEHEALTH = "telehealth"
     SELF_MANAGEMENT = "self_management"
 
-class TriageAgent:
+# Care pathway recommended for each severity level
+_PATHWAY_MAP = {
+    TriageSeverity.EMERGENCY: CarePathway.EMERGENCY_ROOM,
+    TriageSeverity.URGENT: CarePathway.URGENT_CARE,
+    TriageSeverity.SEMI_URGENT: CarePathway.PRIMARY_CARE,
+    TriageSeverity.ROUTINE: CarePathway.TELEHEALTH,
+    TriageSeverity.SELF_CARE: CarePathway.SELF_MANAGEMENT
+}
+
+# Serialized severity and care pathway fields of the triage result, per severity
+_RESULT_BASE = {
+    severity: {"severity": _LABELS[severity], "care_pathway": pathway.value}
+    for severity, pathway in _PATHWAY_MAP.items()
+}
+
+# Care instructions for each pathway when the symptoms involve a child
+_INSTR_PEDIATRIC = {
+    CarePathway.EMERGENCY_ROOM:
+        "SEEK IMMEDIATE MEDICAL ATTENTION FOR YOUR CHILD. Go to the nearest pediatric emergency room or call emergency services (911). "
+        "For infants and young children, emergency symptoms require immediate professional evaluation.",
+    
+    CarePathway.URGENT_CARE:
+        "Take your child to a pediatric urgent care center within 24 hours. If symptoms worsen, go to the emergency room immediately. "
+        "Children can deteriorate quickly, so close monitoring is essential.",
+    
+    CarePathway.PRIMARY_CARE:
+        "Schedule an appointment with your child's pediatrician within the next few days. "
+        "In the meantime, monitor your child's symptoms closely and ensure they stay hydrated.",
+    
+    CarePathway.TELEHEALTH:
+        "Consider scheduling a telehealth appointment with your child's pediatrician. "
+        "Have a thermometer and other relevant home medical equipment ready for the consultation.",
+    
+    CarePathway.SELF_MANAGEMENT:
+        "Your child's symptoms can likely be managed at home with appropriate care. "
+        "Ensure they get plenty of rest, stay hydrated, and monitor their temperature regularly. "
+        "If symptoms persist beyond 48 hours, worsen suddenly, or if your child appears unusually lethargic, consult a healthcare provider."
+}
+
+# Care instructions for each pathway for adults
+_INSTR_ADULT = {
+    CarePathway.EMERGENCY_ROOM:
+        "SEEK IMMEDIATE MEDICAL ATTENTION. Go to the nearest emergency room or call emergency services (911).",
+    
+    CarePathway.URGENT_CARE:
+        "Visit an urgent care center within 24 hours. If symptoms worsen, go to the emergency room.",
+    
+    CarePathway.PRIMARY_CARE:
+        "Schedule an appointment with your primary care physician within the next few days.",
+    
+    CarePathway.TELEHEALTH:
+        "Consider scheduling a telehealth appointment with a healthcare provider.",
+    
+    CarePathway.SELF_MANAGEMENT:
+        "Your symptoms can likely be managed at home with rest and over-the-counter remedies. "
+        "If symptoms persist or worsen, consult a healthcare provider."
+}
+
+class HyperscanPattern:
     """
-    A decision tree-based agent for medical triage
+    A set of regex patterns compiled into one Hyperscan database, exposing
+    search(), and lowest_id() when the patterns carry labels
     """
     
-    def __init__(self):
-        """Initialize the triage agent with decision rules"""
-        # Emergency symptoms that require immediate medical attention
-        self.emergency_indicators = [
-            r"difficulty breathing", r"shortness of breath", r"chest pain", 
-            r"severe (pain|bleeding)", r"unconscious", r"unresponsive",
-            r"stroke", r"heart attack", r"seizure", r"unable to (speak|move)",
-            r"sudden (numbness|weakness)", r"severe head(ache)? with (fever|stiff neck)",
-            r"suicidal", r"overdose", r"poisoning",
-            # Pediatric emergency indicators
-            r"(baby|infant|child).*(not breathing|turning blue|choking)",
-            r"(baby|infant|child).*(unresponsive|unconscious|won't wake up)",
-            r"(baby|infant|child).*(seizure|convulsion)",
-            r"(baby|infant|child).*(severe dehydration|not urinating)",
-            r"(baby|infant|child).*(rash.*(doesn't blanch|doesn't fade))",
-            r"(baby|infant|child).*(lethargic|extremely weak)",
-            r"(baby|infant|child).*(high fever.*(under|less than) (3|three) months)"
-        ]
+    __slots__ = ("_db", "_local")
+    
+    def __init__(self, patterns: List[str], ids: Optional[List[int]] = None):
+        """
+        Compile the patterns into a case-insensitive Hyperscan database
         
-        # Urgent symptoms that require prompt but not immediate care
-        self.urgent_indicators = [
-            r"high fever", r"persistent vomiting", r"dehydration",
-            r"infection", r"moderate (pain|bleeding)", r"broken bone",
-            r"deep cut", r"burn", r"allergic reaction", r"pregnancy complication",
-            r"severe (rash|swelling)", r"eye injury", r"mental health crisis",
-            # Pediatric urgent indicators
-            r"(baby|infant|child).*(fever.*(102|103|104|105))",
-            r"(baby|infant|child).*(not feeding|refusing to eat|drink)",
-            r"(baby|infant|child).*(unusual (crying|screaming))",
-            r"(baby|infant|child).*(bulging fontanelle)",
-            r"(baby|infant|child).*(persistent vomiting|diarrhea)"
-        ]
+        Args:
+            patterns: List of regex patterns
+            ids: Label for each pattern (defaults to its index)
+        """
+        self._db = hyperscan.Database()
+        self._db.compile(
+            expressions=[pattern.encode() for pattern in patterns],
+            ids=ids if ids is not None else list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_SINGLEMATCH] * len(patterns)
+        )
+        # Scratch space can't be shared between concurrent scans, so keep one per thread
+        self._local = threading.local()
+    
+    def _scratch(self) -> Any:
+        """
+        Get this thread's scratch space, allocating it on first use
+        
+        Returns:
+            Hyperscan scratch space for scanning self._db
+        """
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None:
+            scratch = self._local.scratch = hyperscan.Scratch(self._db)
+        return scratch
+    
+    def search(self, text: str) -> bool:
+        """
+        Scan the text, stopping at the first match
+        
+        Args:
+            text: Text to scan
+            
+        Returns:
+            True if any of the patterns matched
+        """
+        matched: List[int] = []
+        def on_match(pattern_id: int, start: int, end: int, flags: int, context: Any) -> bool:
+            matched.append(pattern_id)
+            return True  # Abort the scan
         
-        # Semi-urgent symptoms
-        self.semi_urgent_indicators = [
-            r"ear(ache|infection)", r"sinus (pain|infection)", r"minor infection",
-            r"mild to moderate pain", r"(sprain|strain)", r"minor injury",
-            r"persistent symptoms", r"worsening chronic condition",
-            r"fever.*(101|102)", r"swollen.*(ankle|joint|knee|wrist)",
-            r"diarrhea.*(3|three|several) days", r"persistent diarrhea",
-            r"fall", r"fell", r"falling", r"twisted", r"twist",
-            r"asthma.*(significantly worse|severe|attack)",
-            r"blood sugar.*(very high|dangerously high|extremely elevated)",
-            r"(diabetes|diabetic).*(uncontrolled|out of control)",
-            r"back pain.*(severe|debilitating|can't move)",
-            # Pediatric semi-urgent indicators
-            r"(baby|infant|child).*(ear infection|ear pain)",
-            r"(baby|infant|child).*(fever.*(100|101))",
-            r"(baby|infant|child).*(mild rash)",
-            r"(baby|infant|child).*(cough|cold).*(several days)"
-        ]
+        try:
+            self._db.scan(text.encode("utf-8", "ignore"), match_event_handler=on_match, scratch=self._scratch())
+        except hyperscan.ScanTerminated:
+            pass
+        return bool(matched)
+    
+    def lowest_id(self, text: str) -> Optional[int]:
+        """
+        Scan the text once, tracking the lowest label that matched
         
-        # Routine care symptoms
-        self.routine_indicators = [
-            r"chronic condition", r"follow-up", r"medication refill",
-            r"mild symptoms", r"general check-up", r"non-urgent concern",
-            r"mild (rash|pain)", r"routine screening",
-            r"asthma.*(worse|worsening)", r"persistent.*(pain|ache)",
-            r"blood sugar.*(higher|elevated|abnormal)",
-            r"(diabetes|diabetic).*(control|management)",
-            r"back pain.*(chronic|persistent|ongoing)",
-            r"(month|months|week|weeks|day|days)",
-            # Pediatric routine indicators
-            r"(baby|infant|child).*(mild fever)",
-            r"(baby|infant|child).*(minor cough|runny nose)",
-            r"(baby|infant|child).*(diaper rash)",
-            r"(baby|infant|child).*(feeding question|growth concern)"
-        ]
+        Args:
+            text: Text to scan
+            
+        Returns:
+            The lowest matching label, or None if nothing matched
+        """
+        lowest: List[int] = []
+        def on_match(pattern_id: int, start: int, end: int, flags: int, context: Any) -> bool:
+            if not lowest or pattern_id < lowest[0]:
+                lowest[:] = [pattern_id]
+            return pattern_id == 0  # Nothing ranks below 0, so stop there
         
-        # Self-care symptoms
-        self.self_care_indicators = [
-            r"common cold", r"minor headache", r"mild fever", r"sore throat",
-            r"minor cut", r"scrape", r"bruise", r"mild allergies", 
-            r"mild digestive issues", r"general fatigue", r"tired", r"fatigue",
-            r"runny nose", r"sneezing", r"cough", r"mild cough", r"occasional cough",
-            r"slight headache", r"mild pain", r"minor pain", r"slight pain",
-            r"itchy", r"itching", r"dry skin", r"rash", r"minor rash",
-            r"upset stomach", r"indigestion", r"gas", r"bloating",
-            # Pediatric self-care indicators
-            r"(baby|infant|child).*(slight fever|low-grade fever)",
-            r"(baby|infant|child).*(minor cough|sniffle)",
-            r"(baby|infant|child).*(small scrape|minor bruise)",
-            r"(baby|infant|child).*(teething)",
-            r"(baby|infant|child).*(mild diaper rash)",
-            r"(baby|infant|child).*(occasional fussiness)"
-        ]
-    
-    def _check_pattern_match(self, text: str, patterns: List[str]) -> bool:
+        try:
+            self._db.scan(text.encode("utf-8", "ignore"), match_event_handler=on_match, scratch=self._scratch())
+        except hyperscan.ScanTerminated:
+            pass
+        return lowest[0] if lowest else None
+
+class RegexPattern:
+    """
+    re fallback for HyperscanPattern: the patterns are joined into one
+    case-insensitive bytes regex and matched against the UTF-8 encoded text,
+    which is faster than str matching and keeps ASCII-only \\d/\\s semantics
+    in line with Hyperscan
+    """
+    
+    __slots__ = ("_regex",)
+    
+    def __init__(self, patterns: List[str]):
         """
-        Check if any pattern matches the text
+        Compile the patterns into a single case-insensitive bytes regex
         
         Args:
-            text: Text to check
             patterns: List of regex patterns
+        """
+        alternation = "|".join(f"(?:{pattern})" for pattern in patterns)
+        self._regex = re.compile(alternation.encode(), re.IGNORECASE)
+    
+    def search(self, text: str) -> bool:
+        """
+        Scan the text, stopping at the first match
+        
+        Args:
+            text: Text to scan
             
         Returns:
-            True if any pattern matches, False otherwise
+            True if any of the patterns matched
         """
-        text = text.lower()
-        print(f"Checking text: {text}")
-        for pattern in patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                print(f"Matched pattern: {pattern}")
-                return True
-        return False
-    
-    def classify_severity(self, symptoms: str) -> TriageSeverity:
+        return self._regex.search(text.encode("utf-8", "ignore")) is not None
+
+class LabeledRegex:
+    """
+    re fallback for a labeled HyperscanPattern: every label's patterns are
+    joined into one named group and the UTF-8 encoded text is scanned once
+    """
+    
+    __slots__ = ("_regex",)
+    
+    def __init__(self, patterns: List[str], ids: List[int]):
+        """
+        Compile the labeled patterns into a single case-insensitive bytes regex
+        
+        Args:
+            patterns: List of regex patterns
+            ids: Non-negative label for each pattern
+        """
+        by_label: Dict[int, List[str]] = {}
+        for pattern, label in zip(patterns, ids):
+            by_label.setdefault(label, []).append(f"(?:{pattern})")
+        # Lower labels come first, so at each position the lowest matching label wins;
+        # the lookahead lets finditer try every position without consuming text
+        groups = "|".join(f"(?P<l{label}>{'|'.join(by_label[label])})" for label in sorted(by_label))
+        self._regex = re.compile(f"(?=(?:{groups}))".encode(), re.IGNORECASE)
+    
+    def lowest_id(self, text: str) -> Optional[int]:
+        """
+        Scan the text once, tracking the lowest label that matched
+        
+        Args:
+            text: Text to scan
+            
+        Returns:
+            The lowest matching label, or None if nothing matched
+        """
+        lowest: Optional[int] = None
+        for match in self._regex.finditer(text.encode("utf-8", "ignore")):
+            # The outer named group closes last, so lastgroup is always set here
+            label = int(match.lastgroup[1:])  # type: ignore[index]
+            if lowest is None or label < lowest:
+                lowest = label
+                if lowest == 0:
+                    break
+        return lowest
+
+# Matchers built by _compile_patterns and _compile_labeled_patterns
+PatternMatcher = Union[HyperscanPattern, RegexPattern]
+LabeledMatcher = Union[HyperscanPattern, LabeledRegex]
+
+# Emergency symptoms that require immediate medical attention
+EMERGENCY_INDICATORS = [
+    r"difficulty breathing", r"shortness of breath", r"chest pain", 
+    r"severe (pain|bleeding)", r"unconscious", r"unresponsive",
+    r"stroke", r"heart attack", r"seizure", r"unable to (speak|move)",
+    r"sudden (numbness|weakness)", r"severe head(ache)? with (fever|stiff neck)",
+    r"suicidal", r"overdose", r"poisoning",
+    # Pediatric emergency indicators
+    r"(baby|infant|child).*(not breathing|turning blue|choking)",
+    r"(baby|infant|child).*(unresponsive|unconscious|won't wake up)",
+    r"(baby|infant|child).*(seizure|convulsion)",
+    r"(baby|infant|child).*(severe dehydration|not urinating)",
+    r"(baby|infant|child).*(rash.*(doesn't blanch|doesn't fade))",
+    r"(baby|infant|child).*(lethargic|extremely weak)",
+    r"(baby|infant|child).*(high fever.*(under|less than) (3|three) months)"
+]
+
+# Urgent symptoms that require prompt but not immediate care
+URGENT_INDICATORS = [
+    r"high fever", r"persistent vomiting", r"dehydration",
+    r"infection", r"moderate (pain|bleeding)", r"broken bone",
+    r"deep cut", r"burn", r"allergic reaction", r"pregnancy complication",
+    r"severe (rash|swelling)", r"eye injury", r"mental health crisis",
+    # Pediatric urgent indicators
+    r"(baby|infant|child).*(fever.*(102|103|104|105))",
+    r"(baby|infant|child).*(not feeding|refusing to eat|drink)",
+    r"(baby|infant|child).*(unusual (crying|screaming))",
+    r"(baby|infant|child).*(bulging fontanelle)",
+    r"(baby|infant|child).*(persistent vomiting|diarrhea)"
+]
+
+# Semi-urgent symptoms
+SEMI_URGENT_INDICATORS = [
+    r"ear(ache|infection)", r"sinus (pain|infection)", r"minor infection",
+    r"mild to moderate pain", r"(sprain|strain)", r"minor injury",
+    r"persistent symptoms", r"worsening chronic condition",
+    r"fever.*(101|102)", r"swollen.*(ankle|joint|knee|wrist)",
+    r"diarrhea.*(3|three|several) days", r"persistent diarrhea",
+    r"fall", r"fell", r"falling", r"twisted", r"twist",
+    r"asthma.*(significantly worse|severe|attack)",
+    r"blood sugar.*(very high|dangerously high|extremely elevated)",
+    r"(diabetes|diabetic).*(uncontrolled|out of control)",
+    r"back pain.*(severe|debilitating|can't move)",
+    # Pediatric semi-urgent indicators
+    r"(baby|infant|child).*(ear infection|ear pain)",
+    r"(baby|infant|child).*(fever.*(100|101))",
+    r"(baby|infant|child).*(mild rash)",
+    r"(baby|infant|child).*(cough|cold).*(several days)"
+]
+
+# Routine care symptoms
+ROUTINE_INDICATORS = [
+    r"chronic condition", r"follow-up", r"medication refill",
+    r"mild symptoms", r"general check-up", r"non-urgent concern",
+    r"mild (rash|pain)", r"routine screening",
+    r"asthma.*(worse|worsening)", r"persistent.*(pain|ache)",
+    r"blood sugar.*(higher|elevated|abnormal)",
+    r"(diabetes|diabetic).*(control|management)",
+    r"back pain.*(chronic|persistent|ongoing)",
+    r"(month|months|week|weeks|day|days)",
+    # Pediatric routine indicators
+    r"(baby|infant|child).*(mild fever)",
+    r"(baby|infant|child).*(minor cough|runny nose)",
+    r"(baby|infant|child).*(diaper rash)",
+    r"(baby|infant|child).*(feeding question|growth concern)"
+]
+
+# Self-care symptoms
+SELF_CARE_INDICATORS = [
+    r"common cold", r"minor headache", r"mild fever", r"sore throat",
+    r"minor cut", r"scrape", r"bruise", r"mild allergies", 
+    r"mild digestive issues", r"general fatigue", r"tired", r"fatigue",
+    r"runny nose", r"sneezing", r"cough", r"mild cough", r"occasional cough",
+    r"slight headache", r"mild pain", r"minor pain", r"slight pain",
+    r"itchy", r"itching", r"dry skin", r"rash", r"minor rash",
+    r"upset stomach", r"indigestion", r"gas", r"bloating",
+    # Pediatric self-care indicators
+    r"(baby|infant|child).*(slight fever|low-grade fever)",
+    r"(baby|infant|child).*(minor cough|sniffle)",
+    r"(baby|infant|child).*(small scrape|minor bruise)",
+    r"(baby|infant|child).*(teething)",
+    r"(baby|infant|child).*(mild diaper rash)",
+    r"(baby|infant|child).*(occasional fussiness)"
+]
+
+# Indicators that the symptoms concern a child
+PEDIATRIC_INDICATORS = [
+    r"(baby|infant|child|kid|toddler|newborn)",
+    r"(\d+)[\s-]*(month|year|week)[\s-]*(old)",
+    r"my son", r"my daughter",
+    r"pediatric", r"children"
+]
+
+def _compile_patterns(patterns: List[str]) -> PatternMatcher:
+    """
+    Compile a list of regex patterns into one matcher, using Hyperscan when
+    available and a single bytes re alternation otherwise
+    
+    Args:
+        patterns: List of regex patterns
+        
+    Returns:
+        Compiled matcher whose search() returns True if any of the patterns matches
+    """
+    if HYPERSCAN_AVAILABLE:
+        try:
+            return HyperscanPattern(patterns)
+        except hyperscan.error as e:
+            logger.warning("Hyperscan could not compile patterns, falling back to re: %s", e)
+    return RegexPattern(patterns)
+
+def _compile_labeled_patterns(labeled: List[Tuple[str, int]]) -> LabeledMatcher:
+    """
+    Compile (pattern, label) pairs into one matcher, using Hyperscan when
+    available and a single bytes re with a named group per label otherwise
+    
+    Args:
+        labeled: List of (regex pattern, non-negative int label) pairs
+        
+    Returns:
+        Compiled matcher whose lowest_id() returns the lowest matching label
+    """
+    patterns = [pattern for pattern, _ in labeled]
+    ids = [label for _, label in labeled]
+    if HYPERSCAN_AVAILABLE:
+        try:
+            return HyperscanPattern(patterns, ids)
+        except hyperscan.error as e:
+            logger.warning("Hyperscan could not compile patterns, falling back to re: %s", e)
+    return LabeledRegex(patterns, ids)
+
+# Compile the severity indicators once at import into one matcher labeled by
+# severity, so a single scan finds the most severe bucket that matches
+_SEVERITY_MATCHER = _compile_labeled_patterns([
+    (pattern, int(severity))
+    for severity, patterns in [
+        (TriageSeverity.EMERGENCY, EMERGENCY_INDICATORS),
+        (TriageSeverity.URGENT, URGENT_INDICATORS),
+        (TriageSeverity.SEMI_URGENT, SEMI_URGENT_INDICATORS),
+        (TriageSeverity.ROUTINE, ROUTINE_INDICATORS)
+    ]
+    for pattern in patterns
+])
+_PEDIATRIC_RE = _compile_patterns(PEDIATRIC_INDICATORS)
+
+class TriageAgent:
+    """
+    A decision tree-based agent for medical triage. The rules and compiled
+    patterns are module-level and shared, so instances carry no state and
+    are free to create
+    """
+    
+    __slots__ = ()
+    
+    # Indicator lists, kept as class attributes for existing callers
+    emergency_indicators = EMERGENCY_INDICATORS
+    urgent_indicators = URGENT_INDICATORS
+    semi_urgent_indicators = SEMI_URGENT_INDICATORS
+    routine_indicators = ROUTINE_INDICATORS
+    self_care_indicators = SELF_CARE_INDICATORS
+    pediatric_indicators = PEDIATRIC_INDICATORS
+    
+    @staticmethod
+    def classify_severity(symptoms: str) -> TriageSeverity:
         """
         Classify the severity of symptoms
         
@@ -145,128 +570,79 @@ class TriageAgent:
         Returns:
             TriageSeverity level
         """
-        print(f"Classifying severity for symptoms: {symptoms}")
+        logger.debug("Classifying severity for symptoms: %s", symptoms)
         
         # Split multiple symptoms if they appear to be in a list format
-        symptom_list = symptoms.split("\n")
-        if len(symptom_list) == 1:
-            # Try splitting by bullet points or dashes
-            if " - " in symptoms:
-                symptom_list = symptoms.split(" - ")
-            elif "• " in symptoms:
-                symptom_list = symptoms.split("• ")
-            elif ", " in symptoms:
-                symptom_list = symptoms.split(", ")
+        if "\n" in symptoms:
+            symptom_list = symptoms.split("\n")
+        else:
+            # Try splitting by dashes, bullet points or commas, in that order
+            for delimiter in _INLINE_DELIMITERS:
+                if delimiter in symptoms:
+                    symptom_list = symptoms.split(delimiter)
+                    break
+            else:
+                symptom_list = [symptoms]
         
-        # Remove empty items and strip whitespace
-        symptom_list = [s.strip() for s in symptom_list if s.strip()]
-        print(f"Parsed symptom list: {symptom_list}")
+        # Strip whitespace once per item and drop empty items
+        symptom_list = [s for s in map(str.strip, symptom_list) if s]
+        logger.debug("Parsed symptom list: %s", symptom_list)
         
-        # Check each symptom individually and take the most severe classification
-        severity_levels = []
+        # Check each symptom individually and keep the most severe classification,
+        # returning as soon as EMERGENCY is reached since nothing can outrank it
+        most_severe = TriageSeverity.SELF_CARE
         
-        for symptom in symptom_list:
-            print(f"Analyzing symptom: {symptom}")
-            
-            # Check for chronic conditions with specific keywords
-            is_chronic = any(term in symptom.lower() for term in ["chronic", "persistent", "ongoing", "months", "weeks"])
-            is_worsening = any(term in symptom.lower() for term in ["worse", "worsening", "increased", "higher", "elevated"])
-            
-            # Add some common symptom patterns that might be missed
-            if any(term in symptom.lower() for term in ["severe", "extreme", "intense", "unbearable", "worst"]):
-                print(f"Detected severe symptom indicators in: {symptom}")
-                if any(term in symptom.lower() for term in ["pain", "headache", "chest", "breathing"]):
-                    print(f"Classified as EMERGENCY due to severe pain/breathing issues in: {symptom}")
-                    severity_levels.append(TriageSeverity.EMERGENCY)
-                    continue
-            
-            # Check for specific chronic conditions
-            if "asthma" in symptom.lower():
-                if any(term in symptom.lower() for term in ["attack", "can't breathe", "severe", "emergency"]):
-                    print(f"Classified as EMERGENCY (severe asthma): {symptom}")
-                    severity_levels.append(TriageSeverity.EMERGENCY)
-                elif is_worsening:
-                    print(f"Classified as SEMI_URGENT (worsening asthma): {symptom}")
-                    severity_levels.append(TriageSeverity.SEMI_URGENT)
-                else:
-                    print(f"Classified as ROUTINE (stable asthma): {symptom}")
-                    severity_levels.append(TriageSeverity.ROUTINE)
-                continue
-                
-            if "blood sugar" in symptom.lower() or "diabetes" in symptom.lower():
-                if any(term in symptom.lower() for term in ["very high", "extremely", "dangerously"]):
-                    print(f"Classified as URGENT (dangerous blood sugar): {symptom}")
-                    severity_levels.append(TriageSeverity.URGENT)
-                elif is_worsening:
-                    print(f"Classified as SEMI_URGENT (elevated blood sugar): {symptom}")
-                    severity_levels.append(TriageSeverity.SEMI_URGENT)
-                else:
-                    print(f"Classified as ROUTINE (blood sugar concern): {symptom}")
-                    severity_levels.append(TriageSeverity.ROUTINE)
-                continue
-                
-            if "back pain" in symptom.lower():
-                if any(term in symptom.lower() for term in ["severe", "can't move", "debilitating"]):
-                    print(f"Classified as SEMI_URGENT (severe back pain): {symptom}")
-                    severity_levels.append(TriageSeverity.SEMI_URGENT)
-                elif is_chronic:
-                    print(f"Classified as ROUTINE (chronic back pain): {symptom}")
-                    severity_levels.append(TriageSeverity.ROUTINE)
-                else:
-                    print(f"Classified as SELF_CARE (mild back pain): {symptom}")
-                    severity_levels.append(TriageSeverity.SELF_CARE)
-                continue
-            
-            # Standard pattern matching
-            if self._check_pattern_match(symptom, self.emergency_indicators):
-                print(f"Classified as EMERGENCY: {symptom}")
-                severity_levels.append(TriageSeverity.EMERGENCY)
-                continue
-            
-            if self._check_pattern_match(symptom, self.urgent_indicators):
-                print(f"Classified as URGENT: {symptom}")
-                severity_levels.append(TriageSeverity.URGENT)
-                continue
-            
-            if self._check_pattern_match(symptom, self.semi_urgent_indicators):
-                print(f"Classified as SEMI_URGENT: {symptom}")
-                severity_levels.append(TriageSeverity.SEMI_URGENT)
-                continue
-            
-            if self._check_pattern_match(symptom, self.routine_indicators):
-                print(f"Classified as ROUTINE: {symptom}")
-                severity_levels.append(TriageSeverity.ROUTINE)
-                continue
+        for severity in map(TriageAgent._classify_one, symptom_list):
+            if severity is TriageSeverity.EMERGENCY:
+                return severity
+            most_severe = min(most_severe, severity)
+        
+        logger.debug("Most severe classification: %s", _LABELS[most_severe])
+        return most_severe
+    
+    @staticmethod
+    def _classify_one(symptom: str) -> TriageSeverity:
+        """
+        Classify the severity of a single symptom
+        
+        Args:
+            symptom: One item from the parsed symptom list
             
-            # If it's a chronic condition that's worsening, at least classify as ROUTINE
-            if is_chronic and is_worsening:
-                print(f"Classified as ROUTINE (worsening chronic condition): {symptom}")
-                severity_levels.append(TriageSeverity.ROUTINE)
-                continue
-                
-            print(f"No specific patterns matched for: {symptom}, defaulting to SELF_CARE")
-            severity_levels.append(TriageSeverity.SELF_CARE)
+        Returns:
+            TriageSeverity level
+        """
+        logger.debug("Analyzing symptom: %s", symptom)
+        flags = _keyword_flags(symptom.lower())
+        
+        # Add some common symptom patterns that might be missed
+        if flags & _SEVERE:
+            logger.debug("Detected severe symptom indicators in: %s", symptom)
+            if flags & _SEVERE_PAIN:
+                logger.debug("Classified as EMERGENCY due to severe pain/breathing issues in: %s", symptom)
+                return TriageSeverity.EMERGENCY
         
-        # If we have multiple severity levels, take the most severe one
-        if severity_levels:
-            # Sort by severity (EMERGENCY is most severe)
-            severity_order = {
-                TriageSeverity.EMERGENCY: 0,
-                TriageSeverity.URGENT: 1,
-                TriageSeverity.SEMI_URGENT: 2,
-                TriageSeverity.ROUTINE: 3,
-                TriageSeverity.SELF_CARE: 4
-            }
-            severity_levels.sort(key=lambda x: severity_order[x])
-            most_severe = severity_levels[0]
-            print(f"Multiple symptoms found. Most severe classification: {most_severe.value}")
-            return most_severe
+        # Check for specific chronic conditions
+        severity = _classify_condition(symptom, flags)
+        if severity is not None:
+            return severity
         
-        # If no symptoms were processed, default to SELF_CARE
-        print("No symptoms were successfully processed, defaulting to SELF_CARE")
+        # Standard pattern matching, one scan for the most severe matching bucket
+        rank = _SEVERITY_MATCHER.lowest_id(symptom)
+        if rank is not None:
+            severity = TriageSeverity(rank)
+            logger.debug("Classified as %s: %s", severity.name, symptom)
+            return severity
+        
+        # If it's a chronic condition that's worsening, at least classify as ROUTINE
+        if flags & _CHRONIC and flags & _WORSENING:
+            logger.debug("Classified as ROUTINE (worsening chronic condition): %s", symptom)
+            return TriageSeverity.ROUTINE
+            
+        logger.debug("No specific patterns matched for: %s, defaulting to SELF_CARE", symptom)
         return TriageSeverity.SELF_CARE
     
-    def recommend_care_pathway(self, severity: TriageSeverity) -> CarePathway:
+    @staticmethod
+    def recommend_care_pathway(severity: TriageSeverity) -> CarePathway:
         """
         Recommend a care pathway based on severity
         
@@ -276,17 +652,10 @@ class TriageAgent:
         Returns:
             Recommended CarePathway
         """
-        pathway_map = {
-            TriageSeverity.EMERGENCY: CarePathway.EMERGENCY_ROOM,
-            TriageSeverity.URGENT: CarePathway.URGENT_CARE,
-            TriageSeverity.SEMI_URGENT: CarePathway.PRIMARY_CARE,
-            TriageSeverity.ROUTINE: CarePathway.TELEHEALTH,
-            TriageSeverity.SELF_CARE: CarePathway.SELF_MANAGEMENT
-        }
-        
-        return pathway_map[severity]
+        return _PATHWAY_MAP[severity]
     
-    def _is_pediatric_case(self, symptoms: str) -> bool:
+    @staticmethod
+    def _is_pediatric_case(symptoms: str) -> bool:
         """
         Determine if the symptoms are related to a pediatric case
         
@@ -296,16 +665,10 @@ class TriageAgent:
         Returns:
             True if pediatric case, False otherwise
         """
-        pediatric_indicators = [
-            r"(baby|infant|child|kid|toddler|newborn)",
-            r"(\d+)[\s-]*(month|year|week)[\s-]*(old)",
-            r"my son", r"my daughter",
-            r"pediatric", r"children"
-        ]
-        
-        return self._check_pattern_match(symptoms, pediatric_indicators)
+        return _PEDIATRIC_RE.search(symptoms)
     
-    def get_care_instructions(self, pathway: CarePathway, symptoms: str = "") -> str:
+    @staticmethod
+    def get_care_instructions(pathway: CarePathway, symptoms: str = "") -> str:
         """
         Get care instructions based on the recommended pathway and symptoms
         
@@ -317,54 +680,11 @@ class TriageAgent:
             Care instructions
         """
         # Check if symptoms involve a child
-        is_pediatric = self._is_pediatric_case(symptoms)
-        
-        if is_pediatric:
-            instructions = {
-                CarePathway.EMERGENCY_ROOM: 
-                    "SEEK IMMEDIATE MEDICAL ATTENTION FOR YOUR CHILD. Go to the nearest pediatric emergency room or call emergency services (911). " +
-                    "For infants and young children, emergency symptoms require immediate professional evaluation.",
-                
-                CarePathway.URGENT_CARE:
-                    "Take your child to a pediatric urgent care center within 24 hours. If symptoms worsen, go to the emergency room immediately. " +
-                    "Children can deteriorate quickly, so close monitoring is essential.",
-                
-                CarePathway.PRIMARY_CARE:
-                    "Schedule an appointment with your child's pediatrician within the next few days. " +
-                    "In the meantime, monitor your child's symptoms closely and ensure they stay hydrated.",
-                
-                CarePathway.TELEHEALTH:
-                    "Consider scheduling a telehealth appointment with your child's pediatrician. " +
-                    "Have a thermometer and other relevant home medical equipment ready for the consultation.",
-                
-                CarePathway.SELF_MANAGEMENT:
-                    "Your child's symptoms can likely be managed at home with appropriate care. " +
-                    "Ensure they get plenty of rest, stay hydrated, and monitor their temperature regularly. " +
-                    "If symptoms persist beyond 48 hours, worsen suddenly, or if your child appears unusually lethargic, consult a healthcare provider."
-            }
-        else:
-            instructions = {
-                CarePathway.EMERGENCY_ROOM: 
-                    "SEEK IMMEDIATE MEDICAL ATTENTION. Go to the nearest emergency room or call emergency services (911).",
-                
-                CarePathway.URGENT_CARE:
-                    "Visit an urgent care center within 24 hours. If symptoms worsen, go to the emergency room.",
-                
-                CarePathway.PRIMARY_CARE:
-                    "Schedule an appointment with your primary care physician within the next few days.",
-                
-                CarePathway.TELEHEALTH:
-                    "Consider scheduling a telehealth appointment with a healthcare provider.",
-                
-                CarePathway.SELF_MANAGEMENT:
-                    "Your symptoms can likely be managed at home with rest and over-the-counter remedies. " +
-                    "If symptoms persist or worsen, consult a healthcare provider."
-            }
-        
-        
+        instructions = _INSTR_PEDIATRIC if TriageAgent._is_pediatric_case(symptoms) else _INSTR_ADULT
         return instructions[pathway]
     
-    def triage_symptoms(self, symptoms: str) -> Dict[str, Any]:
+    @staticmethod
+    def triage_symptoms(symptoms: str) -> Dict[str, Any]:
         """
         Perform triage on symptoms
         
@@ -374,15 +694,30 @@ class TriageAgent:
         Returns:
             Dictionary with triage results
         """
-        severity = self.classify_severity(symptoms)
-        pathway = self.recommend_care_pathway(severity)
-        instructions = self.get_care_instructions(pathway, symptoms)
+        if len(symptoms) > TRIAGE_CACHE_MAX_LENGTH:
+            return TriageAgent._triage(symptoms)
+        # Copy so callers can't mutate the cached result
+        return dict(_triage_cached(symptoms))
+    
+    @staticmethod
+    def _triage(symptoms: str) -> Dict[str, Any]:
+        """
+        Classify symptoms and build the triage result, uncached
+        
+        Args:
+            symptoms: Description of symptoms
+            
+        Returns:
+            Dictionary with triage results
+        """
+        severity = TriageAgent.classify_severity(symptoms)
+        pathway = TriageAgent.recommend_care_pathway(severity)
+        instructions = TriageAgent.get_care_instructions(pathway, symptoms)
         
-        return {
-            "severity": severity.value,
-            "care_pathway": pathway.value,
-            "instructions": instructions
-        }
+        return {**_RESULT_BASE[severity], "instructions": instructions}
+
+# Triage is deterministic, so repeated symptom strings are answered from an LRU cache
+_triage_cached = lru_cache(maxsize=TRIAGE_CACHE_SIZE)(TriageAgent._triage)
 
 # Example usage
 if __name__ == "__main__":